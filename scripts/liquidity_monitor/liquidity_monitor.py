@@ -3,11 +3,17 @@ import httpx
 import urllib.parse
 import os
 import json
-from dataclasses import dataclass
-from typing import Dict, List, Optional
-from datetime import datetime, timedelta
+import heapq
+import statistics
+from bisect import bisect_left
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Iterable, List, Optional, Tuple, Union
+from datetime import datetime, timedelta, timezone
 from enum import Enum
 
+from profiling import LoopProfiler
+
 # ==========================================
 # 📊 DATA STRUCTURES & CONFIG
 # ==========================================
@@ -19,6 +25,14 @@ class LiquidityRisk(Enum):
     CRITICAL = "critical"   # <2%
     RUG_DETECTED = "rug"    # Liquidity removed > 50%
 
+RISK_SEVERITY = {
+    LiquidityRisk.SAFE: 0,
+    LiquidityRisk.MODERATE: 1,
+    LiquidityRisk.RISKY: 2,
+    LiquidityRisk.CRITICAL: 3,
+    LiquidityRisk.RUG_DETECTED: 4,
+}
+
 @dataclass
 class LPPool:
     token_symbol: str
@@ -38,6 +52,244 @@ class LiquiditySnapshot:
     lp_token_supply: float
     holders_count: int
 
+@dataclass
+class LiquidityBar:
+    """OHLC-style rollup of snapshots falling into one tier bucket."""
+    start: datetime
+    timestamp: datetime      # time of the last folded snapshot
+    open: float
+    high: float
+    low: float
+    close: float
+    market_cap_usd: float
+    liq_mcap_ratio: float
+    lp_token_supply: float
+    holders_count: int
+    samples: int = 1
+
+    @property
+    def liquidity_usd(self) -> float:
+        return self.close
+
+    @classmethod
+    def from_snapshot(cls, start: datetime, s: LiquiditySnapshot) -> "LiquidityBar":
+        return cls(
+            start=start,
+            timestamp=s.timestamp,
+            open=s.liquidity_usd,
+            high=s.liquidity_usd,
+            low=s.liquidity_usd,
+            close=s.liquidity_usd,
+            market_cap_usd=s.market_cap_usd,
+            liq_mcap_ratio=s.liq_mcap_ratio,
+            lp_token_supply=s.lp_token_supply,
+            holders_count=s.holders_count,
+        )
+
+    def fold(self, s: LiquiditySnapshot):
+        self.timestamp = s.timestamp
+        self.high = max(self.high, s.liquidity_usd)
+        self.low = min(self.low, s.liquidity_usd)
+        self.close = s.liquidity_usd
+        self.market_cap_usd = s.market_cap_usd
+        self.liq_mcap_ratio = s.liq_mcap_ratio
+        self.lp_token_supply = s.lp_token_supply
+        self.holders_count = s.holders_count
+        self.samples += 1
+
+HistoryPoint = Union[LiquiditySnapshot, LiquidityBar]
+
+@dataclass(frozen=True)
+class HistoryTier:
+    name: str
+    resolution: timedelta    # 0 = raw snapshots, otherwise bucket width
+    retention: timedelta
+    max_points: int
+
+# Raw for 1h, 1-minute bars for 24h, 15-minute bars for 30 days.
+# Bar tiers hold at most retention / resolution + 1 points, the raw tier is
+# additionally capped so fast polling cannot grow it without bound.
+HISTORY_TIERS: Tuple[HistoryTier, ...] = (
+    HistoryTier("raw", timedelta(0), timedelta(hours=1), 1000),
+    HistoryTier("1m", timedelta(minutes=1), timedelta(hours=24), 24 * 60 + 1),
+    HistoryTier("15m", timedelta(minutes=15), timedelta(days=30), 30 * 96 + 1),
+)
+
+class SnapshotHistory:
+    """Time-based, tiered snapshot history for one pool.
+
+    Every snapshot is kept raw and folded into each bar tier. Old points are
+    evicted by age (relative to the newest snapshot) and by a per-tier cap,
+    so memory per pool is bounded independently of the polling interval.
+    """
+
+    def __init__(self, tiers: Tuple[HistoryTier, ...] = HISTORY_TIERS):
+        self.tiers = tiers
+        self.points: Dict[str, Deque[HistoryPoint]] = {
+            t.name: deque(maxlen=t.max_points) for t in tiers
+        }
+        self.total_samples = 0              # snapshots ever appended, not stored
+        # Recent gaps between snapshots; the median is the typical poll
+        # interval, so a single outage gap does not widen match tolerance
+        self.poll_gaps: Deque[timedelta] = deque(maxlen=15)
+
+    @property
+    def latest(self) -> Optional[LiquiditySnapshot]:
+        raw = self.points[self.tiers[0].name]
+        return raw[-1] if raw else None
+
+    def append(self, snapshot: LiquiditySnapshot):
+        if self.latest is not None:
+            self.poll_gaps.append(snapshot.timestamp - self.latest.timestamp)
+        self.total_samples += 1
+        for tier in self.tiers:
+            points = self.points[tier.name]
+            if not tier.resolution:
+                points.append(snapshot)
+            else:
+                start = self._bucket_start(snapshot.timestamp, tier.resolution)
+                if points and points[-1].start == start:
+                    points[-1].fold(snapshot)
+                else:
+                    points.append(LiquidityBar.from_snapshot(start, snapshot))
+
+            cutoff = snapshot.timestamp - tier.retention
+            # Always keep the newest point so a tier never goes empty
+            while len(points) > 1 and points[0].timestamp < cutoff:
+                points.popleft()
+
+    def tier_for(self, target_time: datetime) -> Optional[HistoryTier]:
+        """Finest tier reaching back to target_time, else the one reaching furthest."""
+        best = None
+        for tier in self.tiers:
+            points = self.points[tier.name]
+            if not points:
+                continue
+            if points[0].timestamp <= target_time:
+                return tier
+            if best is None or points[0].timestamp < self.points[best.name][0].timestamp:
+                best = tier
+        return best
+
+    @property
+    def poll_interval(self) -> timedelta:
+        return statistics.median(self.poll_gaps) if self.poll_gaps else timedelta(0)
+
+    def closest(self, target_time: datetime,
+                max_tolerance: Optional[timedelta] = None) -> Optional[HistoryPoint]:
+        """Point nearest to target_time in the matching tier, if close enough.
+
+        The tolerance is two tier steps (or typical poll intervals, whichever
+        is larger), capped at max_tolerance, so a window with no history
+        behind it is reported as missing instead of being compared against
+        an arbitrarily distant point.
+        """
+        tier = self.tier_for(target_time)
+        if tier is None:
+            return None
+        points = self.points[tier.name]
+
+        idx = bisect_left(_TimestampView(points), target_time)
+        candidates = [points[i] for i in (idx - 1, idx) if 0 <= i < len(points)]
+        best = min(candidates, key=lambda p: abs(p.timestamp - target_time))
+
+        tolerance = max(tier.resolution, self.poll_interval) * 2
+        if max_tolerance is not None:
+            tolerance = min(tolerance, max_tolerance)
+        return best if abs(best.timestamp - target_time) <= tolerance else None
+
+    @staticmethod
+    def _bucket_start(ts: datetime, resolution: timedelta) -> datetime:
+        step = resolution.total_seconds()
+        return datetime.fromtimestamp(ts.timestamp() // step * step)
+
+class _TimestampView:
+    """Sequence of timestamps over a time-ordered deque, for bisect."""
+
+    def __init__(self, points: Deque[HistoryPoint]):
+        self.points = points
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def __getitem__(self, i: int) -> datetime:
+        return self.points[i].timestamp
+
+@dataclass
+class TokenAggregate:
+    """Token-level view across all pools/chains trading the same symbol.
+
+    Totals and risk counts are adjusted by the delta of a single pool's
+    update, so refreshing one pool never rescans the token's other pools.
+    Pools that stop updating are moved to `stale_pools`: they drop out of the
+    liquidity totals but their last risk still counts towards the worst-case
+    verdict (fail closed) until a fresh update replaces it.
+    """
+    # Totals below this are float residue from the incremental updates
+    EPSILON_USD = 1e-6
+
+    token_symbol: str
+    total_liquidity_usd: float = 0.0
+    weighted_ratio_sum: float = 0.0   # sum(liquidity * liq_mcap_ratio)
+    # pool_key -> (liquidity_usd, liq_mcap_ratio, risk, updated_at)
+    pools: Dict[str, Tuple[float, float, LiquidityRisk, datetime]] = field(default_factory=dict)
+    stale_pools: Dict[str, Tuple[float, float, LiquidityRisk, datetime]] = field(default_factory=dict)
+    risk_counts: Dict[LiquidityRisk, int] = field(default_factory=dict)
+
+    @property
+    def liq_mcap_ratio(self) -> float:
+        if self.total_liquidity_usd <= self.EPSILON_USD:
+            return 0
+        return self.weighted_ratio_sum / self.total_liquidity_usd
+
+    @property
+    def risk(self) -> LiquidityRisk:
+        for r in sorted(RISK_SEVERITY, key=RISK_SEVERITY.get, reverse=True):
+            if self.risk_counts.get(r):
+                return r
+        return LiquidityRisk.SAFE
+
+    def update_pool(self, pool_key: str, liquidity_usd: float, ratio: float,
+                    risk: LiquidityRisk, updated_at: datetime):
+        stale = self.stale_pools.pop(pool_key, None)
+        if stale:
+            self.risk_counts[stale[2]] -= 1
+        self._remove(pool_key)
+
+        self.pools[pool_key] = (liquidity_usd, ratio, risk, updated_at)
+        self.total_liquidity_usd += liquidity_usd
+        self.weighted_ratio_sum += liquidity_usd * ratio
+        self.risk_counts[risk] = self.risk_counts.get(risk, 0) + 1
+
+        if liquidity_usd <= 0:
+            self._rebuild_totals()
+
+    def expire_pool(self, pool_key: str, updated_at: datetime) -> bool:
+        """Mark a pool stale if its last update is still the one at updated_at."""
+        state = self.pools.get(pool_key)
+        if state is None or state[3] != updated_at:
+            return False
+
+        self._remove(pool_key, keep_risk=True)
+        self.stale_pools[pool_key] = state
+        self._rebuild_totals()
+        return True
+
+    def _remove(self, pool_key: str, keep_risk: bool = False):
+        old = self.pools.pop(pool_key, None)
+        if old:
+            old_liq, old_ratio, old_risk, _ = old
+            self.total_liquidity_usd -= old_liq
+            self.weighted_ratio_sum -= old_liq * old_ratio
+            if not keep_risk:
+                self.risk_counts[old_risk] -= 1
+        return old
+
+    def _rebuild_totals(self):
+        # Cheap (few pools per token) and clears accumulated float error
+        self.total_liquidity_usd = sum(s[0] for s in self.pools.values())
+        self.weighted_ratio_sum = sum(s[0] * s[1] for s in self.pools.values())
+
 DEXSCREENER_CHAINS = {
     "bnb": "bsc",
     "bsc": "bsc",
@@ -67,13 +319,22 @@ class LiquidityMonitor:
     def __init__(self, telegram_chat_id: str):
         self.telegram_chat_id = telegram_chat_id
         self.pools: Dict[str, LPPool] = {}
-        self.snapshots: Dict[str, List[LiquiditySnapshot]] = {}
+        self.snapshots: Dict[str, SnapshotHistory] = {}
+        self.tokens: Dict[str, TokenAggregate] = {}
+        # Min-heap of (updated_at, symbol, pool_key); superseded entries are
+        # skipped lazily, so expiry only touches pools that are actually due
+        self._expiry_heap: List[Tuple[datetime, str, str]] = []
+
+    @staticmethod
+    def pool_key(pool: LPPool) -> str:
+        # One key per venue: the same token may trade on several DEXes per chain
+        return f"{pool.chain}:{pool.dex}:{pool.lp_address}"
 
     def add_pool(self, pool: LPPool):
-        key = f"{pool.chain}:{pool.token_symbol}"
+        key = self.pool_key(pool)
         self.pools[key] = pool
         if key not in self.snapshots:
-            self.snapshots[key] = []
+            self.snapshots[key] = SnapshotHistory()
         print(f"✅ [Monitor] Added pool: {pool.token_symbol} on {pool.dex} ({pool.chain})")
 
     def record_snapshot(self, pool_key: str, liquidity_usd: float,
@@ -90,22 +351,25 @@ class LiquidityMonitor:
         )
 
         self.snapshots[pool_key].append(snapshot)
-        if len(self.snapshots[pool_key]) > 1000:
-            self.snapshots[pool_key] = self.snapshots[pool_key][-1000:]
 
         return snapshot
 
     def analyze_liquidity_change(self, pool_key: str) -> dict:
-        snapshots = self.snapshots.get(pool_key, [])
-        if len(snapshots) < 2:
-            return {"risk": LiquidityRisk.SAFE, "change_pct": 0, "changes": {}}
-
-        current = snapshots[-1]
+        history = self.snapshots.get(pool_key)
+        if history is None or history.total_samples < 2:
+            result = {"risk": LiquidityRisk.SAFE, "change_pct": 0, "changes": {}}
+            if history is not None and history.latest is not None:
+                result["current_liquidity"] = history.latest.liquidity_usd
+                result["liq_mcap_ratio"] = history.latest.liq_mcap_ratio
+                result["timestamp"] = history.latest.timestamp
+            return result
+
+        current = history.latest
         comparisons = {}
 
         for label, minutes in [("5m", 5), ("1h", 60), ("24h", 1440)]:
             target_time = current.timestamp - timedelta(minutes=minutes)
-            past = self._find_closest_snapshot(snapshots, target_time)
+            past = history.closest(target_time, max_tolerance=timedelta(minutes=minutes) / 2)
 
             if past:
                 change = (current.liquidity_usd - past.liquidity_usd) / past.liquidity_usd if past.liquidity_usd > 0 else 0
@@ -124,18 +388,6 @@ class LiquidityMonitor:
             "timestamp": current.timestamp
         }
 
-    def _find_closest_snapshot(self, snapshots: List[LiquiditySnapshot], target_time: datetime) -> Optional[LiquiditySnapshot]:
-        closest = None
-        min_diff = timedelta(hours=24)
-
-        for s in snapshots:
-            diff = abs(s.timestamp - target_time)
-            if diff < min_diff:
-                min_diff = diff
-                closest = s
-
-        return closest
-
     def _calculate_risk(self, current: LiquiditySnapshot, comparisons: dict) -> LiquidityRisk:
         ratio = current.liq_mcap_ratio
         if ratio < self.THRESHOLDS["liq_mcap_risky"]:
@@ -163,6 +415,35 @@ class LiquidityMonitor:
 
         return base_risk
 
+    def update_token(self, pool_key: str, analysis: dict) -> TokenAggregate:
+        """Fold one pool's latest analysis into its token aggregate."""
+        symbol = self.pools[pool_key].token_symbol
+        token = self.tokens.get(symbol)
+        if token is None:
+            token = self.tokens[symbol] = TokenAggregate(symbol)
+
+        updated_at = analysis.get("timestamp") or datetime.now()
+        token.update_pool(
+            pool_key,
+            analysis.get("current_liquidity", 0) or 0,
+            analysis.get("liq_mcap_ratio", 0) or 0,
+            analysis["risk"],
+            updated_at,
+        )
+        heapq.heappush(self._expiry_heap, (updated_at, symbol, pool_key))
+        return token
+
+    def expire_stale_pools(self, max_age: timedelta) -> List[TokenAggregate]:
+        """Mark pools not updated within max_age stale in their token aggregates."""
+        cutoff = datetime.now() - max_age
+        expired: Dict[str, TokenAggregate] = {}
+        while self._expiry_heap and self._expiry_heap[0][0] < cutoff:
+            updated_at, symbol, pool_key = heapq.heappop(self._expiry_heap)
+            token = self.tokens[symbol]
+            if token.expire_pool(pool_key, updated_at):
+                expired[symbol] = token
+        return list(expired.values())
+
     def check_lp_unlock(self, pool_key: str) -> Optional[dict]:
         pool = self.pools.get(pool_key)
         if not pool or not pool.lock_expiry:
@@ -185,10 +466,15 @@ class LiquidityMonitor:
 class LiquidityAlertIntegration:
     ALERT_LOG_FILE = "alerts_liquidity.csv"
     FLAGS_FILE = "liquidity_flags.json"
+    # Pools without a successful update for this many intervals stop counting
+    STALE_POOL_INTERVALS = 3
 
-    def __init__(self, liquidity_monitor: LiquidityMonitor, telegram_bot_token: str):
+    def __init__(self, liquidity_monitor: LiquidityMonitor, telegram_bot_token: str,
+                 profiler: Optional[LoopProfiler] = None):
         self.monitor = liquidity_monitor
         self.telegram_bot_token = telegram_bot_token
+        self.profiler = profiler or LoopProfiler()
+        self.published_risk: Dict[str, LiquidityRisk] = {}
 
     def _log_alert_to_file(self, pool: LPPool, analysis: dict, kind: str):
         """Log alert to CSV file."""
@@ -211,11 +497,8 @@ class LiquidityAlertIntegration:
         except Exception as e:
             print(f"[LiquidityMonitor] Failed to log alert: {e}")
 
-    def _update_liquidity_flag(self, pool: LPPool, analysis: dict):
-        """Update liquidity flag JSON for MM bot."""
-        symbol = pool.token_symbol
-        risk_val = analysis["risk"].value if hasattr(analysis["risk"], "value") else str(analysis["risk"])
-
+    def _update_liquidity_flags(self, tokens: Iterable[TokenAggregate]):
+        """Update liquidity flag JSON for MM bot (one worst-case flag per token)."""
         flags = {}
         if os.path.exists(self.FLAGS_FILE):
             try:
@@ -224,10 +507,29 @@ class LiquidityAlertIntegration:
             except:
                 flags = {}
 
-        flags[symbol] = {
-            "risk": risk_val,
-            "updated_at": datetime.utcnow().isoformat() + "Z"
-        }
+        now = datetime.utcnow().isoformat() + "Z"
+        for token in tokens:
+            # A token with only stale pools keeps its last flag so it ages out
+            if not token.pools:
+                continue
+
+            pools = {}
+            for stale, states in ((False, token.pools), (True, token.stale_pools)):
+                for key, (_, _, risk, updated_at) in states.items():
+                    pools[key] = {
+                        "risk": risk.value,
+                        "updated_at": updated_at.astimezone(timezone.utc).replace(tzinfo=None).isoformat() + "Z",
+                        "stale": stale,
+                    }
+
+            self.published_risk[token.token_symbol] = token.risk
+            flags[token.token_symbol] = {
+                "risk": token.risk.value,
+                "updated_at": now,
+                "total_liquidity_usd": token.total_liquidity_usd,
+                "liq_mcap_ratio": token.liq_mcap_ratio,
+                "pools": dict(sorted(pools.items())),
+            }
 
         tmp = self.FLAGS_FILE + ".tmp"
         try:
@@ -240,34 +542,57 @@ class LiquidityAlertIntegration:
     async def periodic_check(self, interval_seconds: int = 300):
         print(f"🔄 Starting periodic check (every {interval_seconds}s)...")
         while True:
-            for pool_key, pool in self.monitor.pools.items():
-                try:
-                    data = await self._fetch_liquidity_data(pool)
-
-                    self.monitor.record_snapshot(
-                        pool_key,
-                        data["liquidity_usd"],
-                        data["market_cap_usd"],
-                        data["lp_supply"],
-                        data["holders"]
-                    )
-
-                    analysis = self.monitor.analyze_liquidity_change(pool_key)
-
-                    print(f"   📊 {pool.token_symbol}: ${data['liquidity_usd']:,.0f} Liq | Risk: {analysis['risk'].value}")
-
-                    # Always update flag with current risk state
-                    self._update_liquidity_flag(pool, analysis)
-
-                    if analysis["risk"] in [LiquidityRisk.CRITICAL, LiquidityRisk.RUG_DETECTED]:
-                        await self._send_alert(pool, analysis)
-
-                    unlock = self.monitor.check_lp_unlock(pool_key)
-                    if unlock and unlock["status"] in ["UNLOCKED", "WARNING"]:
-                        await self._send_unlock_alert(pool, unlock)
-
-                except Exception as e:
-                    print(f"❌ [Error] {pool.token_symbol}: {e}")
+            prof = self.profiler
+            dirty: Dict[str, TokenAggregate] = {}
+            with prof.stage("cycle"):
+                for pool_key, pool in self.monitor.pools.items():
+                    try:
+                        with prof.stage("fetch"):
+                            data = await self._fetch_liquidity_data(pool)
+
+                        with prof.stage("record_snapshot", warn_slow=True):
+                            self.monitor.record_snapshot(
+                                pool_key,
+                                data["liquidity_usd"],
+                                data["market_cap_usd"],
+                                data["lp_supply"],
+                                data["holders"]
+                            )
+
+                        with prof.stage("analyze", warn_slow=True):
+                            analysis = self.monitor.analyze_liquidity_change(pool_key)
+
+                        print(f"   📊 {pool.token_symbol}: ${data['liquidity_usd']:,.0f} Liq | Risk: {analysis['risk'].value}")
+
+                        # Always refresh the token-level risk state. A changed verdict is
+                        # published right away (before alerting) so the bot can halt;
+                        # unchanged tokens are batched into one write per cycle.
+                        token = self.monitor.update_token(pool_key, analysis)
+                        if token.risk != self.published_risk.get(token.token_symbol):
+                            with prof.stage("flag_publish", warn_slow=True):
+                                self._update_liquidity_flags([token])
+                            dirty.pop(token.token_symbol, None)
+                        else:
+                            dirty[token.token_symbol] = token
+
+                        with prof.stage("alert_dispatch"):
+                            if analysis["risk"] in [LiquidityRisk.CRITICAL, LiquidityRisk.RUG_DETECTED]:
+                                await self._send_alert(pool, analysis)
+
+                            unlock = self.monitor.check_lp_unlock(pool_key)
+                            if unlock and unlock["status"] in ["UNLOCKED", "WARNING"]:
+                                await self._send_unlock_alert(pool, unlock)
+
+                    except Exception as e:
+                        print(f"❌ [Error] {pool.token_symbol}: {e}")
+
+                max_age = timedelta(seconds=interval_seconds * self.STALE_POOL_INTERVALS)
+                for token in self.monitor.expire_stale_pools(max_age):
+                    dirty[token.token_symbol] = token
+
+                if dirty:
+                    with prof.stage("flag_publish", warn_slow=True):
+                        self._update_liquidity_flags(dirty.values())
 
             await asyncio.sleep(interval_seconds)
 
@@ -2,6 +2,7 @@ import asyncio
 import os
 from dotenv import load_dotenv
 from liquidity_monitor import setup_liquidity_monitoring, LiquidityAlertIntegration
+from profiling import LoopProfiler
 
 # Load env from parent directory if needed, or local .env
 # Try loading from current dir first
@@ -24,8 +25,21 @@ async def main():
 
     interval = int(os.getenv("LIQ_MONITOR_INTERVAL", "300"))
 
+    profiler = LoopProfiler()
+    if os.getenv("LIQ_PROFILE", "0") == "1":
+        profiler.slow_stage_ms = float(os.getenv("LIQ_PROFILE_SLOW_STAGE_MS", "500"))
+        # SIGUSR1 prints stage percentiles, SIGUSR2 dumps a sampling profile
+        slow_cb = os.getenv("LIQ_PROFILE_SLOW_CALLBACK_MS")
+        port = os.getenv("LIQ_PROFILE_PORT")
+        profiler.install(
+            asyncio.get_running_loop(),
+            report_interval=float(os.getenv("LIQ_PROFILE_REPORT_INTERVAL", "300")),
+            slow_callback_ms=float(slow_cb) if slow_cb else None,
+            control_port=int(port) if port else None,
+        )
+
     monitor = setup_liquidity_monitoring(chat_id)
-    integration = LiquidityAlertIntegration(monitor, telegram_bot_token)
+    integration = LiquidityAlertIntegration(monitor, telegram_bot_token, profiler=profiler)
 
     print(f"🚀 Liquidity Monitor started for chat {chat_id}")
     await integration.periodic_check(interval_seconds=interval)
@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Deque, Dict, Optional
+
+# ==========================================
+# ⏱️ ROLLING STAGE STATS
+# ==========================================
+
+class StageStats:
+    """Rolling window of durations (seconds) for one stage."""
+
+    def __init__(self, window: int = 1000):
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.count = 0
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+        self.count += 1
+
+    def percentile(self, pct: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        idx = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+        return ordered[idx]
+
+# ==========================================
+# 🔬 EVENT LOOP PROFILER
+# ==========================================
+
+class LoopProfiler:
+    """Per-stage timers, event-loop lag probe and on-demand sampling profiler.
+
+    Stage timers are always cheap to record; `install()` additionally starts
+    the lag probe, periodic percentile report, signal handlers
+    (SIGUSR1 = print report, SIGUSR2 = sampling profile dump) and an optional
+    localhost control port (send "stats" or "profile [seconds]").
+
+    Slow-stage warnings are off unless `slow_stage_ms` is set, and only fire
+    for stages timed with `warn_slow=True` (synchronous work that blocks the
+    loop, not awaited network I/O).
+    """
+
+    LAG_STAGE = "loop_lag"
+    MAX_PROFILE_SECONDS = 300.0
+
+    def __init__(self, window: int = 1000, slow_stage_ms: Optional[float] = None,
+                 lag_interval: float = 0.5, profile_dir: str = "."):
+        self.window = window
+        self.slow_stage_ms = slow_stage_ms
+        self.lag_interval = lag_interval
+        self.profile_dir = profile_dir
+        self.stages: Dict[str, StageStats] = {}
+        self._tasks = []
+        self._profiling = False
+
+    @contextmanager
+    def stage(self, name: str, warn_slow: bool = False):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - t0, warn_slow)
+
+    def record(self, name: str, seconds: float, warn_slow: bool = False):
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages[name] = StageStats(self.window)
+        stats.add(seconds)
+
+        if warn_slow and self.slow_stage_ms is not None and seconds * 1000 > self.slow_stage_ms:
+            print(f"🐢 [Profiler] Slow {name}: {seconds * 1000:.1f}ms")
+
+    def report(self) -> str:
+        lines = [f"⏱️ [Profiler] {'stage':<18}{'n':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9} (ms)"]
+        for name in sorted(self.stages):
+            s = self.stages[name]
+            lines.append(
+                f"   {name:<27}{s.count:>8}"
+                f"{s.percentile(50) * 1000:>9.1f}"
+                f"{s.percentile(95) * 1000:>9.1f}"
+                f"{s.percentile(99) * 1000:>9.1f}"
+                f"{max(s.samples, default=0) * 1000:>9.1f}"
+            )
+        return "\n".join(lines)
+
+    # ---------- install ----------
+
+    def install(self, loop: asyncio.AbstractEventLoop,
+                report_interval: float = 300, slow_callback_ms: Optional[float] = None,
+                control_port: Optional[int] = None):
+        self._tasks.append(loop.create_task(self._lag_probe()))
+        if report_interval > 0:
+            self._tasks.append(loop.create_task(self._report_loop(report_interval)))
+
+        if slow_callback_ms:
+            # asyncio debug mode logs every callback/step exceeding the threshold
+            loop.set_debug(True)
+            loop.slow_callback_duration = slow_callback_ms / 1000
+            logger = logging.getLogger("asyncio")
+            if not logger.handlers:
+                logger.addHandler(logging.StreamHandler())
+            logger.setLevel(logging.WARNING)
+
+        try:
+            loop.add_signal_handler(signal.SIGUSR1, lambda: print(self.report()))
+            loop.add_signal_handler(signal.SIGUSR2, self.dump_profile)
+        except (AttributeError, NotImplementedError, RuntimeError) as e:
+            print(f"⚠️ [Profiler] Signal handlers unavailable: {e}")
+
+        if control_port:
+            self._tasks.append(loop.create_task(self._serve_control(control_port)))
+
+        slow = f"{self.slow_stage_ms:.0f}ms" if self.slow_stage_ms is not None else "off"
+        print(f"🔬 [Profiler] Installed (lag probe every {self.lag_interval}s, slow stage > {slow})")
+
+    async def _lag_probe(self):
+        while True:
+            t0 = time.perf_counter()
+            await asyncio.sleep(self.lag_interval)
+            lag = time.perf_counter() - t0 - self.lag_interval
+            self.record(self.LAG_STAGE, max(0.0, lag), warn_slow=True)
+
+    async def _report_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            print(self.report())
+
+    async def _serve_control(self, port: int):
+        async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+            try:
+                parts = (await reader.readline()).decode().split()
+                if parts and parts[0] == "profile":
+                    try:
+                        seconds = float(parts[1]) if len(parts) > 1 else 10.0
+                    except ValueError:
+                        seconds = None
+                    if seconds is None or not 0 < seconds <= self.MAX_PROFILE_SECONDS:
+                        reply = f"usage: profile [seconds], 0 < seconds <= {self.MAX_PROFILE_SECONDS:.0f}\n"
+                    else:
+                        path = self.dump_profile(seconds)
+                        reply = f"profiling {seconds:.0f}s -> {path}\n" if path else "profile already running\n"
+                else:
+                    reply = self.report() + "\n"
+                writer.write(reply.encode())
+                await writer.drain()
+            finally:
+                writer.close()
+
+        server = await asyncio.start_server(handle, "127.0.0.1", port)
+        print(f"🔬 [Profiler] Control port listening on 127.0.0.1:{port}")
+        async with server:
+            await server.serve_forever()
+
+    # ---------- sampling profiler ----------
+
+    def dump_profile(self, seconds: float = 10.0, interval: float = 0.005) -> Optional[str]:
+        """Sample the event-loop thread in the background and write collapsed stacks.
+
+        Output is one `frame;frame;... count` line per stack (flamegraph.pl /
+        speedscope compatible). Returns the output path, or None if a dump is
+        already running.
+        """
+        if self._profiling:
+            print("⚠️ [Profiler] Profile dump already running")
+            return None
+        self._profiling = True
+
+        target = threading.get_ident()
+        path = os.path.join(
+            self.profile_dir, f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.folded"
+        )
+        worker = threading.Thread(
+            target=self._sample, args=(target, seconds, interval, path), daemon=True
+        )
+        worker.start()
+        print(f"🔬 [Profiler] Sampling for {seconds:.0f}s -> {path}")
+        return path
+
+    def _sample(self, target: int, seconds: float, interval: float, path: str):
+        stacks: Counter = Counter()
+        try:
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                frame = sys._current_frames().get(target)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                if stack:
+                    stacks[";".join(reversed(stack))] += 1
+                time.sleep(interval)
+
+            with open(path, "w") as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            print(f"✅ [Profiler] Wrote {sum(stacks.values())} samples to {path}")
+        except Exception as e:
+            print(f"[Profiler] Failed to write profile: {e}")
+        finally:
+            self._profiling = False
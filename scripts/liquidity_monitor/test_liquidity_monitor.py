@@ -0,0 +1,83 @@
+import json
+from datetime import datetime, timedelta
+
+from liquidity_monitor import (
+    LiquidityAlertIntegration,
+    LiquidityMonitor,
+    LiquidityRisk,
+    LPPool,
+)
+
+
+def make_pool(chain: str, dex: str, lp_address: str, symbol: str = "HYPE") -> LPPool:
+    return LPPool(token_symbol=symbol, token_address="", lp_address=lp_address, dex=dex, chain=chain)
+
+
+def analysis(risk: LiquidityRisk, liquidity: float, timestamp: datetime) -> dict:
+    return {"risk": risk, "current_liquidity": liquidity, "liq_mcap_ratio": 0.1, "timestamp": timestamp}
+
+
+def test_same_chain_venues_get_separate_keys():
+    monitor = LiquidityMonitor("chat")
+    monitor.add_pool(make_pool("base", "uniswap", "0xaaa"))
+    monitor.add_pool(make_pool("base", "pancakeswap", "0xbbb"))
+
+    assert sorted(monitor.pools) == ["base:pancakeswap:0xbbb", "base:uniswap:0xaaa"]
+
+
+def test_stale_rug_pool_keeps_token_blocked():
+    monitor = LiquidityMonitor("chat")
+    rug, safe = make_pool("base", "uniswap", "0xaaa"), make_pool("bsc", "pancakeswap", "0xbbb")
+    monitor.add_pool(rug)
+    monitor.add_pool(safe)
+
+    old = datetime.now() - timedelta(hours=1)
+    monitor.update_token(monitor.pool_key(rug), analysis(LiquidityRisk.RUG_DETECTED, 1000, old))
+    token = monitor.update_token(monitor.pool_key(safe), analysis(LiquidityRisk.SAFE, 90000, datetime.now()))
+    assert token.risk == LiquidityRisk.RUG_DETECTED
+
+    expired = monitor.expire_stale_pools(timedelta(minutes=15))
+
+    assert expired == [token]
+    assert monitor.pool_key(rug) in token.stale_pools
+    assert token.total_liquidity_usd == 90000
+    assert token.risk == LiquidityRisk.RUG_DETECTED
+
+    # A fresh update replaces the stale verdict
+    monitor.update_token(monitor.pool_key(rug), analysis(LiquidityRisk.SAFE, 50000, datetime.now()))
+    assert token.risk == LiquidityRisk.SAFE
+    assert token.total_liquidity_usd == 140000
+
+
+def test_expiry_skips_superseded_updates():
+    monitor = LiquidityMonitor("chat")
+    pool = make_pool("base", "uniswap", "0xaaa")
+    monitor.add_pool(pool)
+
+    key = monitor.pool_key(pool)
+    monitor.update_token(key, analysis(LiquidityRisk.SAFE, 1000, datetime.now() - timedelta(hours=1)))
+    token = monitor.update_token(key, analysis(LiquidityRisk.SAFE, 2000, datetime.now()))
+
+    assert monitor.expire_stale_pools(timedelta(minutes=15)) == []
+    assert key in token.pools
+
+
+def test_flag_marks_stale_pools(tmp_path):
+    monitor = LiquidityMonitor("chat")
+    rug, safe = make_pool("base", "uniswap", "0xaaa"), make_pool("bsc", "pancakeswap", "0xbbb")
+    monitor.add_pool(rug)
+    monitor.add_pool(safe)
+    integration = LiquidityAlertIntegration(monitor, "token")
+    integration.FLAGS_FILE = str(tmp_path / "liquidity_flags.json")
+
+    monitor.update_token(monitor.pool_key(rug), analysis(LiquidityRisk.CRITICAL, 1000, datetime.now() - timedelta(hours=1)))
+    token = monitor.update_token(monitor.pool_key(safe), analysis(LiquidityRisk.SAFE, 90000, datetime.now()))
+    monitor.expire_stale_pools(timedelta(minutes=15))
+    integration._update_liquidity_flags([token])
+
+    with open(integration.FLAGS_FILE) as f:
+        flag = json.load(f)["HYPE"]
+    assert flag["risk"] == "critical"
+    assert flag["pools"]["base:uniswap:0xaaa"]["stale"] is True
+    assert flag["pools"]["bsc:pancakeswap:0xbbb"]["stale"] is False
+    assert integration.published_risk["HYPE"] == LiquidityRisk.CRITICAL
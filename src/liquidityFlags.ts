@@ -14,6 +14,16 @@ export type LiquidityRisk =
 export interface LiquidityFlag {
     risk: LiquidityRisk;
     updated_at: string;
+    // Token-level aggregate across all monitored pools/chains
+    total_liquidity_usd?: number;
+    liq_mcap_ratio?: number;
+    pools?: Record<string, LiquidityPoolFlag>;
+}
+
+export interface LiquidityPoolFlag {
+    risk: LiquidityRisk;
+    updated_at: string;
+    stale: boolean;
 }
 
 export type LiquidityFlagMap = Record<string, LiquidityFlag>;